@@ -19,6 +19,17 @@ ALLOWED_KEYS = [
     "Xian Bridged",
     "Volume Played",
 ]
+ALLOWED_KEYS_SET = set(ALLOWED_KEYS)   # O(1) membership for is_allowed
+
+# (upper bound, tier) ascending; anything above the last bound is TOP_TIER
+TIERS = [
+    (500, "Leafling"),
+    (1500, "Vine Crawler"),
+    (3000, "Canopy Dweller"),
+    (5000, "Rainkeeper"),
+    (10000, "Jaguar Fang"),
+]
+TOP_TIER = "Spirit of the Jungle"
 
 MintEvent = LogEvent(
     event='Mint',
@@ -27,7 +38,8 @@ MintEvent = LogEvent(
 
 TraitUpdatedEvent = LogEvent(
     event='TraitUpdated',
-    params={'user': {'type': str, 'idx': True}, 'key': {'type': str}, 'value': {'type': str}}
+    # user + key are indexed so monitors can filter by topic; value stays data
+    params={'user': {'type': str, 'idx': True}, 'key': {'type': str, 'idx': True}, 'value': {'type': str}}
 )
 
 TraitsBatchUpdatedEvent = LogEvent(
@@ -61,12 +73,17 @@ def mint(to: str, uri: str):
 def init_defaults(addr: str):
     """
     Defaults: numeric traits "0"; Tier "Leafling".
+    Unrolled (keep in sync with ALLOWED_KEYS): Hash has no multi-set,
+    so this just drops the loop and per-key branch.
     """
-    for k in ALLOWED_KEYS:
-        if k == "Tier":
-            traits[addr, "Tier"] = "Leafling"
-        else:
-            traits[addr, k] = "0"
+    traits[addr, "Score"] = "0"
+    traits[addr, "Tier"] = "Leafling"
+    traits[addr, "Stake Duration"] = "0"
+    traits[addr, "DEX Volume"] = "0"
+    traits[addr, "Pulse Influence"] = "0"
+    traits[addr, "Trx Volume"] = "0"
+    traits[addr, "Xian Bridged"] = "0"
+    traits[addr, "Volume Played"] = "0"
 
 @export
 def update_trait(key: str, value: str):
@@ -74,19 +91,21 @@ def update_trait(key: str, value: str):
     Update a single trait for the caller (must own SBT).
     Auto-updates Tier if Score is updated.
     """
-    assert sbt_holders[ctx.caller] is True, "Must hold an SBT"
+    caller = ctx.caller
+    assert sbt_holders[caller] is True, "Must hold an SBT"
     assert is_allowed(key), "key not allowed"
     v = str(value)
 
     if key == "Score":
-        traits[ctx.caller, "Score"] = v
-        traits[ctx.caller, "Tier"] = tier_for_score(to_int(v))
-        TraitUpdatedEvent({'user': ctx.caller, 'key': "Score", 'value': v})
-        TraitUpdatedEvent({'user': ctx.caller, 'key': "Tier", 'value': traits[ctx.caller, "Tier"]})
+        new_tier = tier_for_score(to_int(v))
+        traits[caller, "Score"] = v
+        traits[caller, "Tier"] = new_tier
+        TraitUpdatedEvent({'user': caller, 'key': "Score", 'value': v})
+        TraitUpdatedEvent({'user': caller, 'key': "Tier", 'value': new_tier})
         return
 
-    traits[ctx.caller, key] = v
-    TraitUpdatedEvent({'user': ctx.caller, 'key': key, 'value': v})
+    traits[caller, key] = v
+    TraitUpdatedEvent({'user': caller, 'key': key, 'value': v})
 
 @export
 def update_traits(batch: dict):
@@ -96,7 +115,8 @@ def update_traits(batch: dict):
     If Score is present, Tier is recomputed automatically.
     Bounded to max 10 keys per call.
     """
-    assert sbt_holders[ctx.caller] is True, "Must hold an SBT"
+    caller = ctx.caller
+    assert sbt_holders[caller] is True, "Must hold an SBT"
 
     # bound number of keys to protect stamps
     count_keys = 0
@@ -107,13 +127,18 @@ def update_traits(batch: dict):
     changed = 0
 
     # If Score is included, apply first so Tier can be recomputed
+    # (only written when the value actually changes, like the other keys)
     if "Score" in batch:
         vscore = str(batch["Score"])
-        traits[ctx.caller, "Score"] = vscore
-        traits[ctx.caller, "Tier"] = tier_for_score(to_int(vscore))
-        TraitUpdatedEvent({'user': ctx.caller, 'key': "Score", 'value': vscore})
-        TraitUpdatedEvent({'user': ctx.caller, 'key': "Tier", 'value': traits[ctx.caller, "Tier"]})
-        changed = changed + 2
+        if traits[caller, "Score"] != vscore:
+            traits[caller, "Score"] = vscore
+            TraitUpdatedEvent({'user': caller, 'key': "Score", 'value': vscore})
+            changed = changed + 1
+        new_tier = tier_for_score(to_int(vscore))
+        if traits[caller, "Tier"] != new_tier:
+            traits[caller, "Tier"] = new_tier
+            TraitUpdatedEvent({'user': caller, 'key': "Tier", 'value': new_tier})
+            changed = changed + 1
 
     # Update remaining keys (except Score/Tier which we handled)
     for k in ALLOWED_KEYS:
@@ -122,12 +147,12 @@ def update_traits(batch: dict):
         v_in = batch.get(k)
         if v_in is not None:
             v = str(v_in)
-            if traits[ctx.caller, k] != v:
-                traits[ctx.caller, k] = v
-                TraitUpdatedEvent({'user': ctx.caller, 'key': k, 'value': v})
+            if traits[caller, k] != v:
+                traits[caller, k] = v
+                TraitUpdatedEvent({'user': caller, 'key': k, 'value': v})
                 changed = changed + 1
 
-    TraitsBatchUpdatedEvent({'user': ctx.caller, 'count': changed})
+    TraitsBatchUpdatedEvent({'user': caller, 'count': changed})
 
 @export
 def get_trait(user: str, key: str):
@@ -155,24 +180,14 @@ def has_sbt(address: str):
 # -------- helpers (pure) --------
 
 def tier_for_score(score_val: int):
-    s = to_int(score_val)
-    if s < 500:
-        return "Leafling"
-    if s < 1500:
-        return "Vine Crawler"
-    if s < 3000:
-        return "Canopy Dweller"
-    if s < 5000:
-        return "Rainkeeper"
-    if s < 10000:
-        return "Jaguar Fang"
-    return "Spirit of the Jungle"
+    # callers pass to_int(...) already
+    for limit, name in TIERS:
+        if score_val < limit:
+            return name
+    return TOP_TIER
 
 def is_allowed(k: str):
-    for x in ALLOWED_KEYS:
-        if x == k:
-            return True
-    return False
+    return k in ALLOWED_KEYS_SET
 
 def to_int(x):
     # safe int coercion without try/except and without len()
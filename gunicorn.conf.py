@@ -0,0 +1,14 @@
+# Production server for the traits API:  gunicorn server:app
+# `python server.py` is the single-threaded Werkzeug dev server, local use only.
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# gevent workers make the blocking requests/pymongo calls cooperative, so one
+# slow GraphQL round-trip no longer holds up every other client
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_connections = 1000
+
+timeout = 30
+keepalive = 5
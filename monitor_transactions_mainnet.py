@@ -1,9 +1,26 @@
+import json
 import requests
 import time
-from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from pymongo import InsertOne, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    import orjson as _json  # C parser, much faster on large GraphQL responses
+except ImportError:
+    _json = json
 
 GRAPHQL_URL = "https://node.xian.org/graphql"
 
+# One keep-alive session so polls reuse the TCP+TLS connection
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# Last seen block height, persisted so restarts don't replay
+CURSOR_FILE = "mainnet_cursor.json"
+PAGE_SIZE = 200
+
 # MongoDB config (match server/testnet)
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB = "xian_monitor"
@@ -21,71 +38,156 @@ def setup_db():
     traits_col.create_index("address", unique=True)
     processed_col.create_index("tx_hash", unique=True)
 
-def ensure_user_exists(address):
-    traits_col.update_one(
-        {"address": address},
-        {"$setOnInsert": {"score": 0, "amount": 0.0}},
-        upsert=True,
-    )
-
-def has_processed(tx_hash):
-    return processed_col.count_documents({"tx_hash": tx_hash}, limit=1) > 0
-
-def mark_processed(tx_hash):
+# Recently processed tx hashes, answered in-process before asking Mongo
+SEEN_CACHE_SIZE = 50_000
+_seen = OrderedDict()
+
+def remember_processed(tx_hashes):
+    for h in tx_hashes:
+        _seen[h] = None
+        _seen.move_to_end(h)
+    while len(_seen) > SEEN_CACHE_SIZE:
+        _seen.popitem(last=False)
+
+def preload_seen():
+    cursor = processed_col.find({}, {"_id": 0, "tx_hash": 1}).sort("_id", -1).limit(SEEN_CACHE_SIZE)
+    remember_processed(reversed([doc["tx_hash"] for doc in cursor]))
+
+def processed_hashes(tx_hashes):
+    seen = {h for h in tx_hashes if h in _seen}
+    misses = [h for h in tx_hashes if h not in _seen]
+    if misses:
+        cursor = processed_col.find({"tx_hash": {"$in": misses}}, {"_id": 0, "tx_hash": 1})
+        found = [doc["tx_hash"] for doc in cursor]
+        remember_processed(found)
+        seen.update(found)
+    return seen
+
+def mark_processed(tx_hashes):
+    if not tx_hashes:
+        return
+    remember_processed(tx_hashes)
     try:
-        processed_col.insert_one({"tx_hash": tx_hash})
-    except Exception:
+        processed_col.bulk_write([InsertOne({"tx_hash": h}) for h in tx_hashes], ordered=False)
+    except BulkWriteError:
         # Ignore duplicates
         pass
 
-def increment_score_and_amount(address, score, amount):
-    traits_col.update_one(
-        {"address": address},
-        {"$inc": {"score": score, "amount": amount}},
-        upsert=True,
-    )
+def upsert_scores(totals):
+    # $inc on upsert creates the fields, so new users start from 0 implicitly
+    if not totals:
+        return
+    traits_col.bulk_write([
+        UpdateOne({"address": address}, {"$inc": {"score": score, "amount": amount}}, upsert=True)
+        for address, (score, amount) in totals.items()
+    ], ordered=False)
+
+# (contract, function, points, amount_field); "%" matches any contract
+EVENT_SPECS = [
+    ("%",                   "transfer",                1,  "amount"),   # 🔁 Transfer
+    ("con_dex_v2",          "swapExactTokenForToken",  5,  None),       # 💱 Swap
+    ("con_staking_v1",      "deposit",                15,  None),       # 📥 Stake
+    ("con_xipoll_v0_clean", "vote",                    5,  None),       # 🗳️ Voting
+    ("submission",          "submit_contract",        50,  None),       # 📜 Contract submitting
+]
+SPEC_BY_KIND = {(c, f): (pts, amt) for c, f, pts, amt in EVENT_SPECS}
+
+# Static GraphQL document; the cursor/order/filter go in as variables
+TX_QUERY = """
+query($filter: TransactionFilter!, $orderBy: [TransactionsOrderBy!], $first: Int!) {
+  allTransactions(condition: { success: true }, filter: $filter, orderBy: $orderBy, first: $first) {
+    edges {
+      node {
+        blockHeight
+        hash
+        contract
+        function
+        sender
+        jsonContent
+      }
+    }
+  }
+}
+"""
+
+def kind_filter(contract, function):
+    # exact matches hit the node's column indexes; LIKE patterns force a scan
+    if contract == "%":
+        return {"function": {"equalTo": function}}
+    return {"and": [{"contract": {"equalTo": contract}}, {"function": {"equalTo": function}}]}
 
-def run_query(contract, function, points, amount_field=None):
+# OR of every watched (contract, function), built once
+KIND_FILTER = {"or": [kind_filter(c, f) for c, f, _, _ in EVENT_SPECS]}
+
+def load_cursor():
+    try:
+        with open(CURSOR_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cursor(cursor):
+    with open(CURSOR_FILE, "w") as f:
+        json.dump(cursor, f)
+
+LAST_HEIGHT = load_cursor()
+
+def next_cursor(last, top, full_page):
+    """
+    Height the cursor may move to after reading one ascending page above `last`
+    whose highest block is `top`. A full page can end partway through `top`, so
+    only the blocks below it are known complete; `top` is re-read next poll and
+    the processed-hash check drops the txs already scored.
+    """
+    if not full_page:
+        return top
+    if top - 1 <= last:
+        # the whole page is one block with more than PAGE_SIZE matching txs; can't split it
+        print(f"⚠️  Block {top} has more than {PAGE_SIZE} matching txs; the rest are skipped")
+        return top
+    return top - 1
+
+def match_spec(contract, function):
+    return SPEC_BY_KIND.get((contract, function)) or SPEC_BY_KIND.get(("%", function))
+
+def fetch_events():
+    """
+    Fetch txs for every EVENT_SPECS entry above the block cursor in a single
+    GraphQL request. Returns (events, highest block height seen).
+    On a cold start (no cursor yet) the latest PAGE_SIZE txs are used instead.
+    """
+    last = LAST_HEIGHT.get("events", 0)
     query = {
-        "query": f"""
-        query {{
-          allTransactions(
-            condition: {{ success: true }}
-            filter: {{
-              and: [
-                {{ contract: {{ like: "{contract}" }} }},
-                {{ function: {{ like: "{function}" }} }}
-              ]
-            }}
-            orderBy: BLOCK_TIME_DESC
-            first: 1
-          ) {{
-            edges {{
-              node {{
-                sender
-                jsonContent
-              }}
-            }}
-          }}
-        }}
-        """
+        "query": TX_QUERY,
+        "variables": {
+            "filter": {"and": [{"blockHeight": {"greaterThan": last}}, KIND_FILTER]},
+            "orderBy": ["BLOCK_HEIGHT_ASC" if last else "BLOCK_HEIGHT_DESC"],
+            "first": PAGE_SIZE,
+        },
     }
 
     try:
-        r = requests.post(GRAPHQL_URL, json=query)
+        r = SESSION.post(GRAPHQL_URL, json=query, timeout=5)
         r.raise_for_status()
-        data = r.json()
+        data = _json.loads(r.content)
         edges = data.get("data", {}).get("allTransactions", {}).get("edges", [])
         if not edges:
-            return []
+            return [], last
 
         results = []
+        height = last
         for edge in edges:
             node = edge["node"]
+            height = max(height, node.get("blockHeight") or 0)
+            spec = match_spec(node.get("contract"), node.get("function"))
+            if not spec:
+                continue
+            points, amount_field = spec
+
             sender = node.get("sender")
-            json_data = node.get("jsonContent", {})
-            tx_hash = json_data.get("b_meta", {}).get("hash")
-            kwargs = json_data.get("payload", {}).get("kwargs", {})
+            tx_hash = node.get("hash")
+            # jsonContent is only needed for the kwargs of amount-carrying kinds
+            kwargs = (node.get("jsonContent") or {}).get("payload", {}).get("kwargs", {}) if amount_field else {}
 
             if sender and tx_hash:
                 amount = 0.0
@@ -96,43 +198,41 @@ def run_query(contract, function, points, amount_field=None):
                         amount = 0.0
 
                 results.append((tx_hash, sender, points, amount))
-        return results
+        # cold start reads newest-first and deliberately jumps to the tip
+        return results, next_cursor(last, height, bool(last) and len(edges) == PAGE_SIZE)
 
     except Exception as e:
-        print(f"❌ Error fetching {contract}.{function}:", e)
-        return []
+        print("❌ Error fetching transactions:", e)
+        return [], last
     
 def main_loop():
     print("🚀 Watching for currency.transfer, dex.swap, staking.deposit...")
     while True:
-        all_events = []
-
-        # 🔁 Transfer = 1 point
-        all_events += run_query("%", "transfer", points=1, amount_field="amount")
-
-        # 💱 Swap = 5 points
-        all_events += run_query("con_dex_v2", "swapExactTokenForToken", points=5)
-
-        # 📥 Stake = 15 points
-        all_events += run_query("con_staking_v1", "deposit", points=15)
-
-         # 📥 Voting = 15 points
-        all_events += run_query("con_xipoll_v0_clean", "vote", points=5)
-
-        # Contract submiting = 50 points
-        all_events += run_query("submission", "submit_contract", points=50)
+        all_events, height = fetch_events()
+        seen = processed_hashes({e[0] for e in all_events})
+        to_mark = []
+        totals = {}
 
         for tx_hash, sender, score, amount in all_events:
-            if has_processed(tx_hash):
+            if tx_hash in seen:
                 continue
             print(f"🌟 {sender} earned +{score} pts (tx {tx_hash})")
-            ensure_user_exists(sender)
-            increment_score_and_amount(sender, score, amount)
-            mark_processed(tx_hash)
+            prev_score, prev_amount = totals.get(sender, (0, 0.0))
+            totals[sender] = (prev_score + score, prev_amount + amount)
+            to_mark.append(tx_hash)
+            seen.add(tx_hash)
+
+        upsert_scores(totals)
+        mark_processed(to_mark)
+
+        if height != LAST_HEIGHT.get("events", 0):
+            LAST_HEIGHT["events"] = height
+            save_cursor(LAST_HEIGHT)
 
         time.sleep(3)
 
 
 if __name__ == "__main__":
     setup_db()
+    preload_seen()
     main_loop()
@@ -1,126 +1,223 @@
+import json
 import requests
-import sqlite3
 import time
-from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from pymongo import InsertOne, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    import orjson as _json  # C parser, much faster on large GraphQL responses
+except ImportError:
+    _json = json
 
 GRAPHQL_URL = "https://devnet.xian.org/graphql"
 CONTRACT_NAME = "con_sbtxian"
 SBT_REFRESH_INTERVAL = 60 
 
+# One keep-alive session so polls reuse the TCP+TLS connection
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+# (contract, function, points, amount_field); "%" matches any contract
+EVENT_SPECS = [
+    ("%",                   "transfer",                1,  "amount"),   # 🔁 Transfer
+    ("con_dex_v2",          "swapExactTokenForToken",  5,  None),       # 💱 Swap
+    ("con_staking_v1",      "deposit",                15,  None),       # 📥 Stake
+    ("con_xipoll_v0_clean", "vote",                    5,  None),       # 🗳️ Voting
+    ("submission",          "submit_contract",        50,  None),       # 📜 Contract submitting
+]
+
+# Last seen block height per (contract, function), persisted so restarts don't replay
+CURSOR_FILE = "testnet_cursor.json"
+PAGE_SIZE = 200
+
 client = MongoClient("mongodb://localhost:27017/")
 db = client["xian_monitor"]
 traits_col = db["traits"]
 processed_col = db["processed"]
 
-traits_col.create_index("address", unique=True)
-processed_col.create_index("tx_hash", unique=True)
-
 def setup_db():
    """No schema setup needed for MongoDB, but we'll ensure indexes exist."""
    traits_col.create_index("address", unique=True)
    processed_col.create_index("tx_hash", unique=True)
 
-def ensure_user_exists(address):
-    """Ensure a user exists in the traits collection."""
-    traits_col.update_one(
-        {"address": address},
-        {"$setOnInsert": {"score": 0, "amount": 0.0}},
-        upsert=True
-    )
+# Recently processed tx hashes, answered in-process before asking Mongo
+SEEN_CACHE_SIZE = 50_000
+_seen = OrderedDict()
+
+def remember_processed(tx_hashes):
+    """Add tx hashes to the in-process LRU, evicting the oldest."""
+    for h in tx_hashes:
+        _seen[h] = None
+        _seen.move_to_end(h)
+    while len(_seen) > SEEN_CACHE_SIZE:
+        _seen.popitem(last=False)
+
+def preload_seen():
+    """Warm the LRU with the most recently processed tx hashes."""
+    cursor = processed_col.find({}, {"_id": 0, "tx_hash": 1}).sort("_id", -1).limit(SEEN_CACHE_SIZE)
+    remember_processed(reversed([doc["tx_hash"] for doc in cursor]))
 
-def has_processed(tx_hash):
-    """Check if a transaction hash is already processed."""
-    return processed_col.count_documents({"tx_hash": tx_hash}, limit=1) > 0
+def processed_hashes(tx_hashes):
+    """Return the subset of tx hashes that are already processed (one round-trip)."""
+    seen = {h for h in tx_hashes if h in _seen}
+    misses = [h for h in tx_hashes if h not in _seen]
+    if misses:
+        cursor = processed_col.find({"tx_hash": {"$in": misses}}, {"_id": 0, "tx_hash": 1})
+        found = [doc["tx_hash"] for doc in cursor]
+        remember_processed(found)
+        seen.update(found)
+    return seen
 
-def mark_processed(tx_hash):
-    """Mark a transaction as processed."""
+def mark_processed(tx_hashes):
+    """Mark a batch of transactions as processed."""
+    if not tx_hashes:
+        return
+    remember_processed(tx_hashes)
     try:
-        processed_col.insert_one({"tx_hash": tx_hash})
-    except Exception:
+        processed_col.bulk_write([InsertOne({"tx_hash": h}) for h in tx_hashes], ordered=False)
+    except BulkWriteError:
         # Ignore duplicate key errors
         pass
 
-def increment_score_and_amount(address, score, amount):
-    """Increment a user's score and amount."""
-    traits_col.update_one(
-        {"address": address},
-        {"$inc": {"score": score, "amount": amount}}
-    )
+def upsert_scores(totals):
+    """Apply {address: (score, amount)} increments in one unordered bulk upsert."""
+    if not totals:
+        return
+    traits_col.bulk_write([
+        UpdateOne({"address": address}, {"$inc": {"score": score, "amount": amount}}, upsert=True)
+        for address, (score, amount) in totals.items()
+    ], ordered=False)
+
+HOLDER_KEY_PREFIX = f"{CONTRACT_NAME}.sbt_holders:"
+PREFIX_LEN = len(HOLDER_KEY_PREFIX)
+HOLDERS_PAGE_SIZE = 1000
+
+# Built once; the prefix and cursor travel as variables so the text never changes
+HOLDERS_QUERY = f"""
+query($p: String!, $after: Cursor) {{
+  allStates(
+    filter: {{ key: {{ like: $p }} }},
+    first: {HOLDERS_PAGE_SIZE},
+    after: $after
+  ) {{
+    pageInfo {{
+      hasNextPage
+      endCursor
+    }}
+    edges {{
+      node {{
+        key
+      }}
+    }}
+  }}
+}}
+"""
 
 def get_all_sbt_holders():
-    query = {
-        "query": f"""
-        query {{
-          allStates(
-            filter: {{ key: {{ like: "{CONTRACT_NAME}.sbt_holders:%" }} }},
-            first: 500
-          ) {{
-            edges {{
-              node {{
-                key
-              }}
-            }}
-          }}
-        }}
-        """
-    }
+    """Fetch every SBT holder, following GraphQL pagination until the last page."""
+    holders = set()
+    after = None
     try:
-        r = requests.post(GRAPHQL_URL, json=query)
-        r.raise_for_status()
-        data = r.json()
-        edges = data.get("data", {}).get("allStates", {}).get("edges", [])
-        holders = []
-        for edge in edges:
-            key = edge["node"]["key"]
-            if ":" in key:
-                addr = key.split(":", 1)[1]
-                holders.append(addr)
-        return set(holders)  # use set for fast lookup
+        while True:
+            query = {
+                "query": HOLDERS_QUERY,
+                "variables": {"p": f"{HOLDER_KEY_PREFIX}%", "after": after},
+            }
+            r = SESSION.post(GRAPHQL_URL, json=query, timeout=15)
+            r.raise_for_status()
+            data = _json.loads(r.content)
+            states = data.get("data", {}).get("allStates", {})
+            # keys all share the prefix, so slice instead of split
+            holders.update([e["node"]["key"][PREFIX_LEN:] for e in states.get("edges", [])])
+            page = states.get("pageInfo", {})
+            if not page.get("hasNextPage"):
+                break
+            after = page.get("endCursor")
+        holders.discard("")
+        return holders  # use set for fast lookup
     except Exception as e:
         print("❌ Error fetching holders:", e)
         return set()
 
-def run_query(contract, function, points, amount_field=None):
-    query = {
-        "query": f"""
-        query {{
-          allTransactions(
-            condition: {{ success: true }}
-            filter: {{
-              and: [
-                {{ contract: {{ like: "{contract}" }} }},
-                {{ function: {{ like: "{function}" }} }}
-              ]
-            }}
-            orderBy: BLOCK_TIME_DESC
-            first: 1
-          ) {{
-            edges {{
-              node {{
-                sender
-                jsonContent
-              }}
-            }}
-          }}
-        }}
-        """
-    }
+def load_cursor():
+    try:
+        with open(CURSOR_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cursor(cursor):
+    with open(CURSOR_FILE, "w") as f:
+        json.dump(cursor, f)
+
+LAST_HEIGHT = load_cursor()
+
+def next_cursor(last, top, full_page):
+    """
+    Height the cursor may move to after reading one ascending page above `last`
+    whose highest block is `top`. A full page can end partway through `top`, so
+    only the blocks below it are known complete; `top` is re-read next poll and
+    the processed-hash check drops the txs already scored.
+    """
+    if not full_page:
+        return top
+    if top - 1 <= last:
+        # the whole page is one block with more than PAGE_SIZE matching txs; can't split it
+        print(f"⚠️  Block {top} has more than {PAGE_SIZE} matching txs; the rest are skipped")
+        return top
+    return top - 1
+
+# One static GraphQL document that aliases allTransactions once per EVENT_SPECS
+# entry (k0, k1, ...); each alias gets its own filter/order variables.
+TX_FIELDS = "edges { node { blockHeight hash sender jsonContent } }"
+TX_QUERY = "query(%s) {\n%s\n}" % (
+    ", ".join(f"$f{i}: TransactionFilter!, $o{i}: [TransactionsOrderBy!]" for i in range(len(EVENT_SPECS))),
+    "\n".join(
+        f"  k{i}: allTransactions(condition: {{ success: true }}, filter: $f{i}, orderBy: $o{i}, first: {PAGE_SIZE}) {{ {TX_FIELDS} }}"
+        for i in range(len(EVENT_SPECS))
+    ),
+)
+
+def kind_filter(contract, function):
+    # exact matches hit the node's column indexes; LIKE patterns force a scan
+    if contract == "%":
+        return {"function": {"equalTo": function}}
+    return {"and": [{"contract": {"equalTo": contract}}, {"function": {"equalTo": function}}]}
+
+def run_query():
+    """
+    Fetch txs for every EVENT_SPECS entry above its block cursor in one request,
+    and advance the cursors. On a cold start (no cursor yet) for a kind, the
+    latest PAGE_SIZE txs of that kind are used instead.
+    """
+    variables = {}
+    for i, (contract, function, _, _) in enumerate(EVENT_SPECS):
+        last = LAST_HEIGHT.get(f"{contract}.{function}", 0)
+        variables[f"f{i}"] = {"and": [{"blockHeight": {"greaterThan": last}}, kind_filter(contract, function)]}
+        variables[f"o{i}"] = ["BLOCK_HEIGHT_ASC" if last else "BLOCK_HEIGHT_DESC"]
 
     try:
-        r = requests.post(GRAPHQL_URL, json=query)
+        r = SESSION.post(GRAPHQL_URL, json={"query": TX_QUERY, "variables": variables}, timeout=5)
         r.raise_for_status()
-        data = r.json()
-        edges = data.get("data", {}).get("allTransactions", {}).get("edges", [])
-        if not edges:
-            return []
+        data = _json.loads(r.content).get("data") or {}
+    except Exception as e:
+        print("❌ Error fetching transactions:", e)
+        return []
 
-        results = []
+    results = []
+    for i, (contract, function, points, amount_field) in enumerate(EVENT_SPECS):
+        key = f"{contract}.{function}"
+        last = LAST_HEIGHT.get(key, 0)
+        top = last
+        edges = (data.get(f"k{i}") or {}).get("edges", [])
         for edge in edges:
             node = edge["node"]
+            top = max(top, node.get("blockHeight") or 0)
             sender = node.get("sender")
-            json_data = node.get("jsonContent", {})
-            tx_hash = json_data.get("b_meta", {}).get("hash")
-            kwargs = json_data.get("payload", {}).get("kwargs", {})
+            tx_hash = node.get("hash")
+            kwargs = (node.get("jsonContent") or {}).get("payload", {}).get("kwargs", {}) if amount_field else {}
 
             if sender and tx_hash:
                 amount = 0.0
@@ -131,11 +228,9 @@ def run_query(contract, function, points, amount_field=None):
                         amount = 0.0
 
                 results.append((tx_hash, sender, points, amount))
-        return results
-
-    except Exception as e:
-        print(f"❌ Error fetching {contract}.{function}:", e)
-        return []
+        # cold start reads newest-first and deliberately jumps to the tip
+        LAST_HEIGHT[key] = next_cursor(last, top, bool(last) and len(edges) == PAGE_SIZE)
+    return results
     
 def main_loop():
     print("🚀 Watching for currency.transfer, dex.swap, staking.deposit...")
@@ -143,46 +238,47 @@ def main_loop():
     sbt_holders = set()
     
     while True:
-        # Refresh SBT holders if interval passed
+        # Refresh SBT holders if interval passed (or we still have none)
         now = time.time()
-        if now - last_refresh >= SBT_REFRESH_INTERVAL:
-            sbt_holders = get_all_sbt_holders()
+        if now - last_refresh >= SBT_REFRESH_INTERVAL or not sbt_holders:
+            holders = get_all_sbt_holders()
+            # a failed fetch returns an empty set; keep the last good one in that case
+            if holders or not sbt_holders:
+                sbt_holders = holders
             last_refresh = now
-            print(f"🔄 Refreshed SBT holders list ({len(sbt_holders)} addresses)")        
-        
-        all_events = []
-
-        # 🔁 Transfer = 1 point
-        all_events += run_query("%", "transfer", points=1, amount_field="amount")
-
-        # 💱 Swap = 5 points
-        all_events += run_query("con_dex_v2", "swapExactTokenForToken", points=5)
+            print(f"🔄 Refreshed SBT holders list ({len(sbt_holders)} addresses)")
 
-        # 📥 Stake = 15 points
-        all_events += run_query("con_staking_v1", "deposit", points=15)
+        if not sbt_holders:
+            # polling now would move the cursors past txs we'd drop as non-holder
+            time.sleep(3)
+            continue
 
-         # 📥 Voting = 15 points
-        all_events += run_query("con_xipoll_v0_clean", "vote", points=5)
+        all_events = run_query()
 
-        # Contract submiting = 50 points
-        all_events += run_query("submission", "submit_contract", points=50)
+        # Only holder txs can score, so only look those up
+        all_events = [e for e in all_events if e[1] in sbt_holders]
+        seen = processed_hashes({e[0] for e in all_events})
+        to_mark = []
+        totals = {}
 
         for tx_hash, sender, score, amount in all_events:
-            if sender not in sbt_holders:
-            #    print(f"⛔ Ignored {sender} (no SBT)")
-                continue
-
-            if has_processed(tx_hash):
+            if tx_hash in seen:
                 continue
 
             print(f"🌟 {sender} earned +{score} pts (tx {tx_hash})")
-            ensure_user_exists(sender)
-            increment_score_and_amount(sender, score, amount)
-            mark_processed(tx_hash)
+            prev_score, prev_amount = totals.get(sender, (0, 0.0))
+            totals[sender] = (prev_score + score, prev_amount + amount)
+            to_mark.append(tx_hash)
+            seen.add(tx_hash)
+
+        upsert_scores(totals)
+        mark_processed(to_mark)
+        save_cursor(LAST_HEIGHT)
 
         time.sleep(3)
 
 
 if __name__ == "__main__":
     setup_db()
+    preload_seen()
     main_loop()
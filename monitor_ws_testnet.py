@@ -3,10 +3,10 @@
 Real-time Xian monitor via WebSockets:
 - Subscribes to CometBFT Tx events
 - Decodes each transaction (base64 -> hex -> JSON)
-- Filters for:
+- Dispatches watched (contract, function) pairs through HANDLERS:
     * currency.transfer (points=1, amount from kwargs["amount"])
-    * con_dex_v2.swapExactTokenForToken (points=5)
-    * con_staking_v1.deposit (points=15)
+    * con_dex_v2 / con_dex_router_n swaps (points=5, dex_volume)
+    * con_staking_v1.deposit (points=15) and withdrawals (stake duration)
     * con_xipoll_v0_clean.vote (points=5)
     * submission.submit_contract (points=50)
 - Validates the sender holds your SBT before scoring
@@ -16,14 +16,27 @@ Real-time Xian monitor via WebSockets:
 import os
 import json
 import time
-import base64
 import binascii
 import asyncio
-from typing import Dict, Any, Optional, Tuple, List
+import signal
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple, List
 
 import requests
 import websockets         # pip install websockets
-from pymongo import MongoClient, ASCENDING  # pip install pymongo
+from motor.motor_asyncio import AsyncIOMotorClient  # pip install motor
+from pymongo import ASCENDING, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+try:
+    import orjson as _json  # pip install orjson (C parser, ~3x faster per message)
+except ImportError:
+    _json = json
+
+try:
+    import pybase64 as base64  # pip install pybase64 (SIMD base64 decode)
+except ImportError:
+    import base64
 
 # ======== CONFIG ========
 # Use env vars to flip between testnet/mainnet without touching code.
@@ -38,74 +51,165 @@ COLL_PROCESSED= os.getenv("COLL_PROCESSED","processed")
 # Refresh SBT holder list periodically to avoid per-tx graph lookups
 SBT_REFRESH_INTERVAL = int(os.getenv("SBT_REFRESH_SECS", "20"))  # 5 min
 
-# What to watch
-WATCH_RULES = [
-    ("currency",        "transfer",                1,  "amount"),
-    ("con_dex_v2",      "swapExactTokenForToken",  5,  None),
-    ("con_staking_v1",  "deposit",                15,  None),
-    ("con_xipoll_v0_clean", "vote",                5,  None),
-    ("submission",      "submit_contract",        50,  None),
-]
+# WebSocket buffering: frames queued before the reader falls behind, max frame size
+WS_MAX_QUEUE = 4096
+WS_MAX_SIZE  = 8 * 1024 * 1024
+
+# Messages waiting for a worker (oldest dropped when full) and number of workers
+WS_QUEUE_SIZE = 8192
+WS_WORKERS    = 4
+
+# Processed-hash cache + write buffer (flushed every N inserts or T seconds)
+SEEN_CACHE_SIZE = 100_000
+FLUSH_MAX_OPS   = 500
+FLUSH_INTERVAL  = 0.2
+
+# One keep-alive session (used from the refresh thread only) so holder pages reuse TCP+TLS
+SESSION = requests.Session()
 
 # ======== DB SETUP ========
-mongo = MongoClient(MONGO_URI)
+# Async client: every Mongo round-trip yields to the event loop instead of blocking it
+mongo = AsyncIOMotorClient(MONGO_URI)
 db = mongo[DB_NAME]
 traits_col = db[COLL_TRAITS]
 processed_col = db[COLL_PROCESSED]
-traits_col.create_index([("address", ASCENDING)], unique=True)
-processed_col.create_index([("tx_hash", ASCENDING)], unique=True)
 
+async def setup_db():
+    await traits_col.create_index([("address", ASCENDING)], unique=True)
+    await processed_col.create_index([("tx_hash", ASCENDING)], unique=True)
 
-# ======== HELPERS ========
-def has_processed(tx_hash: str) -> bool:
-    return processed_col.find_one({"tx_hash": tx_hash}) is not None
 
-def mark_processed(tx_hash: str):
-    try:
-        processed_col.insert_one({"tx_hash": tx_hash, "ts": int(time.time())})
-    except Exception:
-        pass  # ignore dup insert races
+# Defaults for a brand-new traits doc (applied via $setOnInsert)
+DEFAULT_TRAITS = {
+    "score": 0,
+    "amount": 0.0,
+    "dex_volume": 0.0,
+    "dex_swaps": 0,
+    "stake_duration_sec": 0,
+    "stake_active": False,
+    "stake_last_update": None,
+    "total_sent_xian": 0.0,
+}
 
-def ensure_user(address: str):
-    traits_col.update_one(
-        {"address": address},
-        {"$setOnInsert": {
-            "address": address,
-            "score": 0,
-            "amount": 0.0,
-            "dex_volume": 0.0,
-            "dex_swaps": 0,
-            "stake_duration_sec": 0,
-            "stake_active": False,
-            "stake_last_update": None,
-            "total_sent_xian": 0.0,
-            "updated_at": time.time(),
-        }},
-        upsert=True
-    )
+# Recently processed tx hashes (LRU) and writes not yet sent to Mongo
+_seen: "OrderedDict[str, None]" = OrderedDict()
+_processed_pending: List[InsertOne] = []
+_traits_pending: List[UpdateOne] = []
 
-def add_points(address: str, score: int, amount_to_add: float = 0.0):
-    traits_col.update_one(
-        {"address": address},
-        {"$inc": {"score": int(score), "amount": float(amount_to_add)}, "$set": {"updated_at": time.time()}}
-    )
+# Addresses known to have a traits doc (no $setOnInsert needed), and those queued to get one
+_ensured: set = set()
+_ensuring: set = set()
 
-def inc_total_sent_xian(address: str, amount: float):
-    traits_col.update_one(
-        {"address": address},
-        {"$inc": {"total_sent_xian": float(amount)}, "$set": {"updated_at": time.time()}}
-    )
+# Stake handlers read then write the same doc; serialize them across workers
+_stake_lock = asyncio.Lock()
+_flush_lock = asyncio.Lock()
 
-def inc_dex_volume(address: str, vol: float):
-    traits_col.update_one(
-        {"address": address},
-        {"$inc": {"dex_volume": float(vol), "dex_swaps": 1}, "$set": {"updated_at": time.time()}}
-    )
+# Current SBT holder set; refresh_loop rebinds it whole, so readers never see a partial set
+sbt_holders: set = set()
+
+
+# ======== HELPERS ========
+async def preload_seen():
+    """Warm the LRU with the most recently processed tx hashes."""
+    cursor = processed_col.find({}, {"_id": 0, "tx_hash": 1}).sort("_id", -1).limit(SEEN_CACHE_SIZE)
+    for doc in reversed(await cursor.to_list(length=SEEN_CACHE_SIZE)):
+        _seen[doc["tx_hash"]] = None
+
+async def preload_ensured():
+    """Load the addresses that already have a traits doc."""
+    async for doc in traits_col.find({}, {"_id": 0, "address": 1}):
+        _ensured.add(doc["address"])
+
+def has_processed(tx_hash: str) -> bool:
+    # LRU only: a miss is treated as new (WS only pushes fresh txs), and the
+    # unique tx_hash index still rejects a replayed insert.
+    return tx_hash in _seen
+
+def mark_processed(tx_hash: str, now_ts: float):
+    _seen[tx_hash] = None
+    _seen.move_to_end(tx_hash)
+    if len(_seen) > SEEN_CACHE_SIZE:
+        _seen.popitem(last=False)
+    _processed_pending.append(InsertOne({"tx_hash": tx_hash, "ts": int(now_ts)}))
+
+def queue_traits(address: str, inc: Dict[str, Any], now_ts: float):
+    """
+    Queue one upsert that creates the user if needed and applies `inc`.
+    """
+    known = address in _ensured
+    if known and not inc:
+        return  # doc exists and there is nothing to add
+    update: Dict[str, Any] = {"$set": {"updated_at": now_ts}}
+    if not known:
+        # a field may not appear in both $setOnInsert and $inc
+        update["$setOnInsert"] = {k: v for k, v in DEFAULT_TRAITS.items() if k not in inc}
+        _ensuring.add(address)
+    if inc:
+        update["$inc"] = inc
+    _traits_pending.append(UpdateOne({"address": address}, update, upsert=True))
+
+async def maybe_flush():
+    if len(_processed_pending) + len(_traits_pending) >= FLUSH_MAX_OPS:
+        await flush_pending()
+
+async def flush_pending():
+    """
+    Write everything queued so far. One flush at a time: when this returns, everything
+    queued before the call has landed. Ops whose write failed go back to the front
+    of the queues for the next flush (nothing buffered is dropped on a Mongo blip).
+    """
+    async with _flush_lock:
+        traits_ops = _traits_pending[:]
+        created = set(_ensuring)
+        processed_ops = _processed_pending[:]
+        _traits_pending.clear()
+        _ensuring.clear()
+        _processed_pending.clear()
+        try:
+            if traits_ops:
+                try:
+                    await traits_col.bulk_write(traits_ops, ordered=False)
+                except BulkWriteError as e:
+                    # unordered: everything else landed; retry the upsert races (E11000,
+                    # a poller created the doc first), drop ops Mongo will never accept
+                    errors = e.details.get("writeErrors", [])
+                    _traits_pending[:0] = [traits_ops[err["index"]] for err in errors if err.get("code") == 11000]
+                    _ensuring.update(created)
+                    rejected = [err for err in errors if err.get("code") != 11000]
+                    if rejected:
+                        print(f"⚠️  Dropped {len(rejected)} rejected trait updates:", rejected[0].get("errmsg"))
+                except BaseException:
+                    # whole batch not confirmed (network error, cancellation): retry it all
+                    _traits_pending[:0] = traits_ops
+                    _ensuring.update(created)
+                    raise
+                else:
+                    _ensured.update(created)
+        finally:
+            # attempted even when the traits write failed
+            if processed_ops:
+                try:
+                    await processed_col.bulk_write(processed_ops, ordered=False, bypass_document_validation=True)
+                except BulkWriteError:
+                    pass  # ignore dup insert races
+                except BaseException:
+                    _processed_pending[:0] = processed_ops
+                    raise
+
+async def flush_loop():
+    """Send whatever is queued every FLUSH_INTERVAL, so a quiet chain doesn't hold writes back."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush_pending()
+        except Exception as e:
+            print("⚠️  Mongo flush failed:", e)
 
-def stake_start_or_refresh(address: str, now_ts: float):
-    doc = traits_col.find_one({"address": address}, {"stake_active": 1, "stake_last_update": 1, "stake_duration_sec": 1})
+async def stake_start_or_refresh(address: str, now_ts: float):
+    await flush_pending()  # read-modify-write: make sure queued upserts landed
+    doc = await traits_col.find_one({"address": address}, {"stake_active": 1, "stake_last_update": 1, "stake_duration_sec": 1})
     if not doc or not doc.get("stake_active"):
-        traits_col.update_one(
+        await traits_col.update_one(
             {"address": address},
             {"$set": {"stake_active": True, "stake_last_update": now_ts, "updated_at": now_ts}}
         )
@@ -113,52 +217,56 @@ def stake_start_or_refresh(address: str, now_ts: float):
         # already active: accrue elapsed then refresh
         last = doc.get("stake_last_update") or now_ts
         elapsed = max(0, int(now_ts - last))
-        traits_col.update_one(
+        await traits_col.update_one(
             {"address": address},
             {"$inc": {"stake_duration_sec": elapsed},
              "$set": {"stake_last_update": now_ts, "updated_at": now_ts}}
         )
 
-def stake_stop(address: str, now_ts: float):
-    doc = traits_col.find_one({"address": address}, {"stake_active": 1, "stake_last_update": 1})
+async def stake_stop(address: str, now_ts: float):
+    await flush_pending()  # read-modify-write: make sure queued upserts landed
+    doc = await traits_col.find_one({"address": address}, {"stake_active": 1, "stake_last_update": 1})
     last = (doc or {}).get("stake_last_update")
     elapsed = max(0, int(now_ts - last)) if last else 0
-    traits_col.update_one(
+    await traits_col.update_one(
         {"address": address},
         {"$inc": {"stake_duration_sec": elapsed},
          "$set": {"stake_active": False, "stake_last_update": now_ts, "updated_at": now_ts}}
     )
 
+HOLDERS_PAGE_SIZE = 5000
+
+# Built once; the key pattern and cursor travel as variables
+HOLDERS_QUERY = f"""
+query($p: String!, $after: Cursor) {{
+  allStates(filter: {{ key: {{ like: $p }} }}, first: {HOLDERS_PAGE_SIZE}, after: $after) {{
+    pageInfo {{ hasNextPage endCursor }}
+    edges {{ node {{ key }} }}
+  }}
+}}
+"""
+HOLDERS_PATTERN = f"{SBT_CONTRACT}.sbt_holders:%"
+
 def get_all_sbt_holders() -> set:
     """
     Uses GraphQL to fetch all keys like `<SBT_CONTRACT>.sbt_holders:<addr>`
-    and returns a set of addresses.
+    (following pagination until the last page) and returns a set of addresses.
     """
-    query = {
-        "query": f"""
-        query {{
-          allStates(
-            filter: {{ key: {{ like: "{SBT_CONTRACT}.sbt_holders:%" }} }},
-            first: 5000
-          ) {{
-            edges {{ node {{ key }} }}
-          }}
-        }}
-        """
-    }
+    out = set()
+    after = None
     try:
-        r = requests.post(GRAPHQL_URL, json=query, timeout=15)
-        r.raise_for_status()
-        edges = (r.json().get("data", {}) or {}).get("allStates", {}).get("edges", []) or []
-        out = set()
-        for e in edges:
-            k = e["node"]["key"]
+        while True:
+            query = {"query": HOLDERS_QUERY, "variables": {"p": HOLDERS_PATTERN, "after": after}}
+            r = SESSION.post(GRAPHQL_URL, json=query, timeout=15)
+            r.raise_for_status()
+            states = (_json.loads(r.content).get("data", {}) or {}).get("allStates", {}) or {}
             # key format: con_sbtxian.sbt_holders:ADDRESS
-            if ":" in k:
-                addr = k.split(":", 1)[1]
-                if addr:
-                    out.add(addr)
-        return out
+            out.update({k.partition(":")[2] for k in (e["node"]["key"] for e in states.get("edges") or [])})
+            page = states.get("pageInfo") or {}
+            if not page.get("hasNextPage"):
+                out.discard("")  # keys without ":" or with nothing after it
+                return out
+            after = page.get("endCursor")
     except Exception as e:
         print("❌ Error fetching SBT holders:", e)
         return set()
@@ -166,42 +274,199 @@ def get_all_sbt_holders() -> set:
 def decode_tx_b64_to_json(tx_b64: str) -> Optional[Dict[str, Any]]:
     """
     Xian txs arrive as base64-encoded bytes that are *hex* of the JSON payload.
-    We need: base64 decode -> hex string -> unhexlify -> JSON.
+    We need: base64 decode -> hex bytes -> unhexlify -> JSON.
+    Stays in bytes the whole way (no str round-trips).
+    Returns None without the hex/JSON work when no watched contract is mentioned.
     """
     try:
-        hex_str = base64.b64decode(tx_b64).decode()          # bytes->hex-as-text
-        raw = binascii.unhexlify(hex_str)                    # hex->bytes
-        return json.loads(raw.decode())                      # bytes->json
+        tx_hex = base64.b64decode(tx_b64)                   # base64->hex bytes
+        if not any(tok in tx_hex for tok in WATCHED_CONTRACT_TOKENS):
+            return None                                     # can't match any rule
+        return _json.loads(binascii.a2b_hex(tx_hex))        # hex->bytes->json
     except Exception as e:
         print("❌ TX decode failed:", e)
         return None
 
-def match_rule(contract: str, func: str) -> Optional[Tuple[int, Optional[str]]]:
-    for c, f, pts, amt_field in WATCH_RULES:
-        if c == contract and f == func:
-            return pts, amt_field
-        # Special: user wanted "%" to mean any contract for currency.transfer (already explicit above)
-    return None
+# ======== HANDLERS ========
+# Each handler scores one (contract, function) for an SBT holder.
+def swap_volume(kwargs: Dict[str, Any]) -> float:
+    for k in ("amountIn", "amount_in", "amount"):
+        if k in kwargs:
+            try:
+                return float(kwargs[k])
+            except (TypeError, ValueError):
+                pass
+    return 1.0
+
+# currency.transfer — points +1, and track total_sent_xian
+async def on_transfer(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    amount = 0.0
+    if "amount" in kwargs:
+        try: amount = float(kwargs["amount"])
+        except (TypeError, ValueError): amount = 0.0
+    queue_traits(sender, {"score": 1, "amount": amount, "total_sent_xian": amount}, now_ts)
+    print(f"⚡ transfer {sender} +1pt | total_sent_xian+={amount}")
+
+# DEX swaps — points +5, track dex_volume (+ count)
+async def on_swap(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    vol = swap_volume(kwargs)
+    queue_traits(sender, {"score": 5, "dex_volume": vol, "dex_swaps": 1}, now_ts)
+    print(f"💱 swap {sender} +5pts | dex_volume+={vol}")
+
+# con_staking_v1.deposit — points +15, mark stake active/refresh
+async def on_stake_deposit(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    queue_traits(sender, {"score": 15}, now_ts)
+    async with _stake_lock:
+        await stake_start_or_refresh(sender, now_ts)
+    print(f"📥 stake start/refresh {sender}")
+
+# con_staking_v1 withdrawals — accrue duration and stop
+async def on_stake_withdraw(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    queue_traits(sender, {}, now_ts)
+    async with _stake_lock:
+        await stake_stop(sender, now_ts)
+    print(f"🏁 stake stop {sender}")
+
+async def on_vote(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    queue_traits(sender, {"score": 5}, now_ts)
+    print(f"🗳️ vote {sender} +5pts")
+
+async def on_submit_contract(sender: str, kwargs: Dict[str, Any], now_ts: float):
+    queue_traits(sender, {"score": 50}, now_ts)
+    print(f"📜 submit_contract {sender} +50pts")
+
+HANDLERS: Dict[Tuple[str, str], Callable[[str, Dict[str, Any], float], Awaitable[None]]] = {
+    ("currency",            "transfer"):                 on_transfer,
+    ("con_dex_v2",          "swapExactTokenForToken"):   on_swap,
+    ("con_dex_router_n",    "swapExactTokenForTokenSupportingFeeOnTransferTokens"): on_swap,
+    ("con_staking_v1",      "deposit"):                  on_stake_deposit,
+    ("con_staking_v1",      "withdraw"):                 on_stake_withdraw,
+    ("con_staking_v1",      "unstake"):                  on_stake_withdraw,
+    ("con_staking_v1",      "emergency_withdraw"):       on_stake_withdraw,
+    ("con_xipoll_v0_clean", "vote"):                     on_vote,
+    ("submission",          "submit_contract"):          on_submit_contract,
+}
+
+# Cheap substring prefilter: the tx bytes are hex of the JSON, so look for the
+# hex of each quoted contract name (an odd-offset hit just means a full parse).
+WATCHED_CONTRACT_TOKENS = [f'"{c}"'.encode().hex().encode() for c in sorted({c for c, _ in HANDLERS})]
+
+# ======== SBT HOLDER REFRESH ========
+async def refresh_holders():
+    """
+    Fetch the holder set in a worker thread (requests is blocking) and swap it in.
+    A failed fetch returns an empty set; keep the last good one in that case.
+    """
+    global sbt_holders
+    holders = await asyncio.to_thread(get_all_sbt_holders)
+    if holders or not sbt_holders:
+        sbt_holders = holders
+    print(f"🔄 Refreshed SBT holders: {len(sbt_holders)} addresses")
+
+async def refresh_loop():
+    while True:
+        await asyncio.sleep(SBT_REFRESH_INTERVAL)
+        await refresh_holders()
 
-# ======== WEBSOCKET LOOP ========
-async def ws_loop():
+# ======== TX PROCESSING ========
+async def process(message, *, _loads=_json.loads, _time=time.time, _has_processed=has_processed,
+                  _decode=decode_tx_b64_to_json, _mark_processed=mark_processed, _handler_for=HANDLERS.get):
     """
-    Subscribes to `Tx` events via JSON-RPC over WebSocket and processes each tx in real time.
+    Handle one raw WS message: dedup, decode, score the sender if it's a watched tx.
+    The keyword defaults bind the hot helpers once, so the per-message body uses
+    local lookups (sbt_holders stays global: refresh_loop rebinds it).
     """
-    last_refresh = 0
-    sbt_holders: set = set()
+    # Parse the envelope (CometBFT JSON-RPC)
+    # Structure typically includes: result.data.value.TxResult.tx (base64) & result.events["tx.hash"]
+    # See CometBFT/Tendermint subscription docs. 
+    payload = _loads(message)
+
+    if "result" not in payload:
+        return
+    result = payload["result"]
+
+    # Pull tx hash if present
+    tx_hash = None
+    evmap = result.get("events") or {}
+    if "tx.hash" in evmap and evmap["tx.hash"]:
+        tx_hash = evmap["tx.hash"][0]
+
+    # Pull base64 tx bytes
+    try:
+        tx_b64 = result["data"]["value"]["TxResult"]["tx"]
+    except (KeyError, TypeError):
+        tx_b64 = None
+
+    if not tx_b64:
+        # Some nodes may wrap differently; skip if no payload
+        return
+
+    # Dedup by tx hash, if we have one
+    if tx_hash and _has_processed(tx_hash):
+        return
+
+    # One clock read per message, shared by every write it causes
+    now_ts = _time()
+
+    # Decode and inspect the tx JSON payload (None if unwatched or undecodable)
+    tx_json = _decode(tx_b64)
+    if not tx_json:
+        # Still mark as processed if we have a hash to avoid re-trying forever
+        if tx_hash:
+            _mark_processed(tx_hash, now_ts)
+        return
+
+    try:
+        payload_obj = tx_json["payload"]
+        sender   = payload_obj["sender"]
+        contract = payload_obj["contract"]
+        func     = payload_obj["function"]
+        kwargs   = payload_obj.get("kwargs") or {}
+    except (KeyError, TypeError, AttributeError):
+        handler = None  # not a contract call we can score
+    else:
+        handler = _handler_for((contract, func))
+
+    # Tracked or not — mark processed so we don't revisit. Do it before the handler:
+    # stake handlers await, and a duplicate delivery picked up by another worker
+    # in that gap must already see the hash.
+    if tx_hash:
+        _mark_processed(tx_hash, now_ts)
 
+    if handler and sender in sbt_holders:
+        await handler(sender, kwargs, now_ts)
+
+async def worker(queue: asyncio.Queue):
     while True:
-        # Refresh SBT holder set
-        now = time.time()
-        if now - last_refresh >= SBT_REFRESH_INTERVAL or not sbt_holders:
-            sbt_holders = get_all_sbt_holders()
-            last_refresh = now
-            print(f"🔄 Refreshed SBT holders: {len(sbt_holders)} addresses")
+        message = await queue.get()
+        try:
+            await process(message)
+            await maybe_flush()
+        except Exception as e:
+            print("⚠️  TX processing failed:", e)
+        finally:
+            queue.task_done()
+        await asyncio.sleep(0)  # unwatched txs never await; let the reader run
 
+# ======== WEBSOCKET LOOP ========
+async def ws_loop(queue: asyncio.Queue):
+    """
+    Subscribes to `Tx` events via JSON-RPC over WebSocket and hands each message
+    to the workers. The reader only enqueues, so slow Mongo writes never stall the socket.
+    """
+    dropped = 0
+    while True:
         try:
             print(f"🔌 Connecting WS: {WS_URL}")
-            async with websockets.connect(WS_URL, max_queue=1000) as ws:
+            # Node is local/LAN: skip permessage-deflate, allow large blocks, detect dead peers
+            async with websockets.connect(
+                WS_URL,
+                max_queue=WS_MAX_QUEUE,
+                max_size=WS_MAX_SIZE,
+                compression=None,
+                ping_interval=20,
+                ping_timeout=20,
+            ) as ws:
                 # Subscribe to Tx events
                 sub = {
                     "jsonrpc": "2.0",
@@ -212,166 +477,58 @@ async def ws_loop():
                 await ws.send(json.dumps(sub))
                 print("✅ Subscribed: tm.event='Tx'")
 
+                full, put = queue.full, queue.put_nowait
                 async for message in ws:
-                    # Parse the envelope (CometBFT JSON-RPC)
-                    # Structure typically includes: result.data.value.TxResult.tx (base64) & result.events["tx.hash"]
-                    # See CometBFT/Tendermint subscription docs. 
-                    payload = json.loads(message)
-
-                    if "result" not in payload:
-                        continue
-                    result = payload["result"]
-
-                    # Pull tx hash if present
-                    tx_hash = None
-                    evmap = result.get("events") or {}
-                    if "tx.hash" in evmap and evmap["tx.hash"]:
-                        tx_hash = evmap["tx.hash"][0]
-
-                    # Pull base64 tx bytes
-                    tx_b64 = None
-                    try:
-                        tx_b64 = (
-                            (((result.get("data") or {}).get("value") or {}).get("TxResult") or {}).get("tx")
-                        )
-                    except Exception:
-                        tx_b64 = None
-
-                    if not tx_b64:
-                        # Some nodes may wrap differently; skip if no payload
-                        continue
-
-                    # Dedup by tx hash, if we have one
-                    if tx_hash and has_processed(tx_hash):
-                        continue
-
-                    # Decode and inspect the tx JSON payload
-                    tx_json = decode_tx_b64_to_json(tx_b64)
-                    if not tx_json:
-                        # Still mark as processed if we have a hash to avoid re-trying forever
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    payload_obj = tx_json.get("payload", {}) or {}
-                    sender   = payload_obj.get("sender")
-                    contract = payload_obj.get("contract")
-                    func     = payload_obj.get("function")
-                    kwargs   = payload_obj.get("kwargs", {}) or {}
-
-                    now_ts = time.time()
-
-                    # currency.transfer — points +1, and track total_sent_xian
-                    if contract == "currency" and func == "transfer":
-                        amount = 0.0
-                        if "amount" in kwargs:
-                            try: amount = float(kwargs["amount"])
-                            except: amount = 0.0
-
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=1, amount_to_add=amount)    # your original behavior
-                            inc_total_sent_xian(sender, amount)           # NEW aggregate
-                            print(f"⚡ transfer {sender} +1pt | total_sent_xian+={amount}")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    # con_dex_v2.swapExactTokenForToken — points +5, track dex_volume (+ count)
-                    if contract == "con_dex_v2" and func == "swapExactTokenForToken":
-                        vol = 1.0
-                        for k in ("amountIn", "amount_in", "amount"):
-                            if k in kwargs:
-                                try:
-                                    vol = float(kwargs[k]); break
-                                except:
-                                    pass
-
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=5, amount_to_add=0.0)
-                            inc_dex_volume(sender, vol)
-                            print(f"💱 swap {sender} +5pts | dex_volume+={vol}")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                                        # con_dex_v2.swapExactTokenForToken — points +5, track dex_volume (+ count)
-                    if contract == "con_dex_router_n" and func == "swapExactTokenForTokenSupportingFeeOnTransferTokens":
-                        vol = 1.0
-                        for k in ("amountIn", "amount_in", "amount"):
-                            if k in kwargs:
-                                try:
-                                    vol = float(kwargs[k]); break
-                                except:
-                                    pass
-
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=5, amount_to_add=0.0)
-                            inc_dex_volume(sender, vol)
-                            print(f"💱 swap {sender} +5pts | dex_volume+={vol}")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    # con_staking_v1.deposit — points +15, mark stake active/refresh
-                    if contract == "con_staking_v1" and func == "deposit":
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=15, amount=0.0)
-                            stake_start_or_refresh(sender, now_ts)
-                            print(f"📥 stake start/refresh {sender}")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    # con_staking_v1 withdrawals — accrue duration and stop
-                    if contract == "con_staking_v1" and func in ("withdraw", "unstake", "emergency_withdraw"):
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            stake_stop(sender, now_ts)
-                            print(f"🏁 stake stop {sender}")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    # other functions you might still want to score (e.g., votes, submissions)
-                    if contract == "con_xipoll_v0_clean" and func == "vote":
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=5, amount=0.0)
-                            print(f"🗳️ vote {sender} +5pts")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    if contract == "submission" and func == "submit_contract":
-                        if sender in sbt_holders:
-                            ensure_user(sender)
-                            add_points(sender, score=50, amount=0.0)
-                            print(f"📜 submit_contract {sender} +50pts")
-                        if tx_hash:
-                            mark_processed(tx_hash)
-                        continue
-
-                    # Not tracked — just mark processed so we don't revisit
-                    if tx_hash:
-                        mark_processed(tx_hash)
-
+                    if full():
+                        # Bursting past what the workers can drain: drop the oldest
+                        queue.get_nowait()
+                        queue.task_done()
+                        dropped += 1
+                        if dropped % 1000 == 1:
+                            print(f"⚠️  TX queue full, dropped {dropped} messages so far")
+                    put(message)
 
         except Exception as e:
             # Connection dropped or failed -> short backoff, then retry
             print("⚠️  WS error:", e)
+            try:
+                await flush_pending()
+            except Exception as fe:
+                print("⚠️  Mongo flush failed:", fe)
             await asyncio.sleep(3.0)
 
 
+async def run():
+    await setup_db()
+    await preload_seen()
+    await preload_ensured()
+    await refresh_holders()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_SIZE)
+    tasks = [asyncio.create_task(refresh_loop()), asyncio.create_task(flush_loop())]
+    tasks += [asyncio.create_task(worker(queue)) for _ in range(WS_WORKERS)]
+    try:
+        # SIGTERM (systemd/docker stop) unwinds like Ctrl-C so the finally below still runs
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows
+    try:
+        await ws_loop(queue)
+    finally:
+        # stop the workers first so nothing is buffered after the last flush
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await flush_pending()
+        except Exception as e:
+            print("⚠️  Final Mongo flush failed:", e)
+
 def main():
     print("🚀 Real-time monitor via WebSockets (Tx events)")
     print(f"   WS: {WS_URL}")
     print(f"   GraphQL: {GRAPHQL_URL}")
     print(f"   SBT contract: {SBT_CONTRACT}")
-    asyncio.run(ws_loop())
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
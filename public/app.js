@@ -152,7 +152,8 @@ if (window.__SBT_APP_INIT__) {
     }
   }
 
-  async function doCompare(e){
+  // fresh: bypass the API's short-lived caches (rereads after an update / Refresh)
+  async function doCompare(e, fresh = false){
     e?.preventDefault?.();
 
     const addr = (addrInput.value.trim() || walletInfo?.address || "").trim();
@@ -168,7 +169,8 @@ if (window.__SBT_APP_INIT__) {
     tableEl.innerHTML = `<div class="spinner"></div>`;
 
     try{
-      const res = await fetch(`${API_BASE}/api/compare_traits?address=${encodeURIComponent(addr)}`);
+      const url = `${API_BASE}/api/compare_traits?address=${encodeURIComponent(addr)}${fresh ? "&fresh=1" : ""}`;
+      const res = await fetch(url, fresh ? { cache: "no-store" } : undefined);
       const data = await res.json();
       last = data;
 
@@ -244,13 +246,13 @@ if (window.__SBT_APP_INIT__) {
 
     console.log("update_traits payload ->", { batch: toSet }); // sanity
     await XianWalletUtils.sendTransaction(CONTRACT, "update_traits", { batch: toSet });
-    setTimeout(doCompare, 1500);
+    setTimeout(() => doCompare(null, true), 1500);
   }
 
   // Wire up
   btnConnect.addEventListener("click", connectWallet);
   btnCompare.addEventListener("click", doCompare);
-  btnRefresh.addEventListener("click", doCompare);
+  btnRefresh.addEventListener("click", (e) => doCompare(e, true));
   document.getElementById("scrollToApp")?.addEventListener("click", () => {
     document.getElementById("appCard")?.scrollIntoView({ behavior: "smooth" });
   });
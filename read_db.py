@@ -1,5 +1,11 @@
+import sys
+import json
 from pymongo import MongoClient
-from pprint import pprint
+
+try:
+    import orjson as _json  # pip install orjson (much faster than pprint on big dumps)
+except ImportError:
+    _json = json
 
 # Connect to local MongoDB
 client = MongoClient("mongodb://localhost:27017/")
@@ -9,10 +15,23 @@ db = client["xian_monitor"]
 traits_col = db["traits"]
 processed_col = db["processed"]
 
-print("\n📜 --- TRAITS COLLECTION ---")
-for doc in traits_col.find():
-    pprint(doc)
+out = sys.stdout.buffer
+
+def _dumps(obj) -> bytes:
+    if _json is not json:
+        return _json.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+def dump(col):
+    """Stream every doc as one JSON line, fetching 1000 docs per round-trip."""
+    for doc in col.find({}, {"_id": 0}).batch_size(1000):
+        out.write(_dumps(doc) + b"\n")
+
+# Banners go to stderr so stdout stays pure JSON Lines (pipe it to jq)
+print("\n📜 --- TRAITS COLLECTION ---", file=sys.stderr)
+dump(traits_col)
+out.flush()
 
-print("\n📜 --- PROCESSED TXS COLLECTION ---")
-for doc in processed_col.find():
-    pprint(doc)
+print("\n📜 --- PROCESSED TXS COLLECTION ---", file=sys.stderr)
+dump(processed_col)
+out.flush()
@@ -1,9 +1,25 @@
 from flask import Flask, request, jsonify, send_from_directory
-from pymongo import MongoClient
+from flask.json.provider import DefaultJSONProvider
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import PyMongoError
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import re
+import json
+from bisect import bisect_right
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
 
+try:
+    import orjson as _json  # pip install orjson (Rust encoder/parser)
+except ImportError:
+    _json = json
+
 # ---- config ----
 MONGO_URI = "mongodb://localhost:27017/"
 MONGO_DB = "xian_monitor"
@@ -11,7 +27,7 @@ TRAITS_COLLECTION = "traits"
 
 GRAPHQL_URL = "https://devnet.xian.org/graphql"
 SBT_CONTRACT = "con_sbtxian_v"   # your merged contract name
-TRAIT_KEYS = [
+TRAIT_KEYS = (
     "Score",
     "Tier",
     "Stake Duration",
@@ -20,7 +36,7 @@ TRAIT_KEYS = [
     "Transaction Volume",
     "Bridge Volume",
     "Volume Played",
-]
+)
 
 # UI → on-chain key mapping
 CHAIN_TO_UI = {
@@ -35,18 +51,49 @@ CHAIN_TO_UI = {
 }
 UI_TO_CHAIN = {v: k for k, v in CHAIN_TO_UI.items()}
 
+# On-chain traits of an address with no state yet (copied per address)
+ONCHAIN_DEFAULTS = {k: ("" if k == "Tier" else 0) for k in TRAIT_KEYS}
+
+# Traits reported in "diffs" (the UI flags Score only; add keys here to compare more)
+DIFF_KEYS = ("Score",)
+
+# Per-address response caches (seconds); stale entries are kept as a fallback
+ONCHAIN_TTL = 15
+OFFCHAIN_TTL = 5
+CACHE_MAX_ENTRIES = 10_000
+
+# Browser cache lifetime for /public assets (seconds). File names aren't content-hashed,
+# so keep this short enough that a deploy is picked up; index.html always revalidates.
+STATIC_MAX_AGE = 3600
+
+# Xian account address: 64 hex chars (ed25519 public key)
+ADDR_RE = re.compile(r"\A[0-9a-fA-F]{64}\Z")
+
+# Upper bound on addresses per /api/compare_traits_batch call
+BATCH_MAX_ADDRESSES = 50
+
+# Tier boundaries (same as the contract): a score below TIER_BOUNDS[i] is TIER_LABELS[i]
+TIER_BOUNDS = (500, 1500, 3000, 5000, 10000)
+TIER_LABELS = ("Leafling", "Vine Crawler", "Canopy Dweller", "Rainkeeper", "Jaguar Fang", "Spirit of the Jungle")
+
 def derive_tier_label(score: int):
-    s = int(score or 0)
-    if s < 500:     return "Leafling"
-    if s < 1500:    return "Vine Crawler"
-    if s < 3000:    return "Canopy Dweller"
-    if s < 5000:    return "Rainkeeper"
-    if s < 10000:   return "Jaguar Fang"
-    return "Spirit of the Jungle"
+    return TIER_LABELS[bisect_right(TIER_BOUNDS, int(score or 0))]
 
 
 # ---- app ----
 app = Flask(__name__, static_folder="public", static_url_path="")
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_MAX_AGE
+
+if _json is not json:
+    class OrjsonProvider(DefaultJSONProvider):
+        """jsonify() through orjson; types orjson doesn't know go through Flask's default."""
+        def dumps(self, obj, **kwargs):
+            return _json.dumps(obj, default=self.default, option=_json.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return _json.loads(s)
+
+    app.json = OrjsonProvider(app)
 # Allow common dev origins; use "*" if you prefer (no cookies are used)
 CORS(
     app,
@@ -59,11 +106,52 @@ CORS(
 )
 
 # ---- db ----
-client = MongoClient(MONGO_URI)
+# One pooled client per process; fail fast instead of hanging a request on a dead server
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=50,
+    minPoolSize=5,
+    serverSelectionTimeoutMS=2000,
+    socketTimeoutMS=5000,
+)
 db = client[MONGO_DB]
 traits_col = db[TRAITS_COLLECTION]
+def ensure_indexes():
+    # Same unique index the monitors own; make sure lookups by address never scan.
+    # Best effort: a down mongod must not stop workers booting (static UI keeps serving).
+    try:
+        traits_col.create_index([("address", ASCENDING)], unique=True)
+    except PyMongoError as e:
+        print("⚠️  Could not ensure traits index:", e)
+
+ensure_indexes()
+
+# Only the fields fetch_offchain_traits reads (current and historical names)
+TRAIT_PROJECTION = {
+    "_id": 0,
+    "score": 1,
+    "stake_seconds": 1,
+    "stake_duration_sec": 1,
+    "dex_volume": 1,
+    "pulse_influence": 1,
+    "transaction_volume": 1,
+    "trx_volume": 1,
+    "total_sent_xian": 1,
+    "amount": 1,
+    "bridge_volume": 1,
+    "xian_bridged": 1,
+    "volume_played": 1,
+}
+# Batch lookups also need the address to match docs back to the request
+BATCH_TRAIT_PROJECTION = {**TRAIT_PROJECTION, "address": 1}
 
 def _to_num(x):
+    # Mongo hands back int/float already; only strings and oddities need parsing
+    t = type(x)
+    if t is int:
+        return x
+    if t is float:
+        return int(x) if x.is_integer() else x
     try:
         f = float(x)
         return int(f) if f.is_integer() else f
@@ -72,107 +160,249 @@ def _to_num(x):
 
 def _first_num(doc, keys, default=0):
     for k in keys:
-        if k in doc and doc.get(k) is not None:
-            return _to_num(doc.get(k))
+        v = doc.get(k)
+        if v is not None:
+            return _to_num(v)
     return default
 
-def as_float(x, default=0.0):
-    try:
-        if isinstance(x, (int, float)): return float(x)
-        if isinstance(x, str) and x.strip() != "": return float(x)
-    except Exception:
-        pass
-    return float(default)
+# UI trait -> doc fields to try in order; 👇 tolerates all historical names you’ve used
+_TRAIT_FIELDS = (
+    ("Stake Duration",     ("stake_seconds", "stake_duration_sec")),
+    ("DEX Volume",         ("dex_volume",)),
+    ("Pulse Influence",    ("pulse_influence",)),
+    ("Transaction Volume", ("transaction_volume", "trx_volume", "total_sent_xian", "amount")),
+    ("Bridge Volume",      ("bridge_volume", "xian_bridged")),
+    ("Volume Played",      ("volume_played",)),
+)
+
+# ---- upstream ----
+# Keep-alive pool to the GraphQL node, shared by all request handlers in this worker
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64))
+SESSION.headers["Content-Type"] = "application/json"  # bodies are pre-encoded bytes
+
+def _dumps(obj) -> bytes:
+    return _json.dumps(obj) if _json is not json else json.dumps(obj, separators=(",", ":")).encode()
+
+# Runs GraphQL fetches (cache misses only) while the request thread reads Mongo.
+# One slot per gevent connection (gunicorn.conf.py), so a stalled upstream can't
+# make requests queue behind each other here.
+_lookup_pool = ThreadPoolExecutor(max_workers=1000)
 
-def as_int(x, default=0):
+# ---- cache ----
+# {address: (fetched_at, traits)} in LRU order
+_onchain_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_offchain_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def cache_lookup(cache, ttl, keys):
+    """Split cached `keys` into (entries younger than `ttl`, older ones kept as fallback)."""
+    now = time.monotonic()
+    fresh, stale = {}, {}
+    with _cache_lock:
+        for key in keys:
+            hit = cache.get(key)
+            if hit:
+                cache.move_to_end(key)
+                (fresh if now - hit[0] < ttl else stale)[key] = hit[1]
+    return fresh, stale
+
+def cache_fill(cache, keys, fresh, stale, fetch_many):
+    """
+    Complete a cache_lookup: fetch everything not fresh with one fetch_many(missing)
+    call and store it; if that fails fall back to the stale values (when we have them all).
+    """
+    out = dict(fresh)
+    missing = [k for k in keys if k not in out]
+    if not missing:
+        return out
+    now = time.monotonic()
     try:
-        if isinstance(x, (int, float)): return int(x)
-        if isinstance(x, str) and x.strip() != "": return int(float(x))
+        fetched = fetch_many(missing)
     except Exception:
-        pass
-    return int(default)
+        if len(stale) == len(missing):
+            out.update(stale)  # stale beats a 500
+            return out
+        raise
+    with _cache_lock:
+        for key, value in fetched.items():
+            cache[key] = (now, value)
+            cache.move_to_end(key)
+        while len(cache) > CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+    out.update(fetched)
+    return out
 
-def get_offchain_traits(address: str):
-    doc = traits_col.find_one({"address": address}) or {}
+def cached_many(cache, ttl, keys, fetch_many):
+    """Serve {key: value} for `keys` through `cache` (see cache_lookup / cache_fill)."""
+    fresh, stale = cache_lookup(cache, ttl, keys)
+    return cache_fill(cache, keys, fresh, stale, fetch_many)
 
-    score           = _first_num(doc, ["score"], 0)
-    stake_seconds   = _first_num(doc, ["stake_seconds", "stake_duration_sec"], 0)
-    dex_volume      = _first_num(doc, ["dex_volume"], 0)
-    pulse_influence = _first_num(doc, ["pulse_influence"], 0)
-    # 👇 tolerate all historical names you’ve used
-    tx_volume       = _first_num(doc, ["transaction_volume", "trx_volume", "total_sent_xian", "amount"], 0)
-    bridge_volume   = _first_num(doc, ["bridge_volume", "xian_bridged"], 0)
-    volume_played   = _first_num(doc, ["volume_played"], 0)
+def cached(cache, ttl, key, fetch):
+    return cached_many(cache, ttl, [key], lambda _: {key: fetch()})[key]
 
-    return {
-        "Score":              score,
-        "Tier":               derive_tier_label(score),
-        "Stake Duration":     stake_seconds,
-        "DEX Volume":         dex_volume,
-        "Pulse Influence":    pulse_influence,
-        "Transaction Volume": tx_volume,
-        "Bridge Volume":      bridge_volume,
-        "Volume Played":      volume_played,
-    }
+# fresh=True treats every cached entry as expired (kept only as the error fallback),
+# for rereads right after the caller changed its traits
+def get_offchain_traits(address: str, fresh=False):
+    ttl = 0 if fresh else OFFCHAIN_TTL
+    return cached(_offchain_cache, ttl, address, lambda: fetch_offchain_traits(address))
 
-def get_onchain_traits(address: str):
-    q = {
-        "query": f"""
-        query {{
-          allStates(
-            filter: {{ key: {{ like: "{SBT_CONTRACT}.traits:{address}:%" }} }},
-            first: 500
-          ) {{
-            edges {{ node {{ key value }} }}
-          }}
-        }}
-        """
-    }
-    r = requests.post(GRAPHQL_URL, json=q, timeout=20)
+def get_offchain_traits_many(addresses, fresh=False):
+    ttl = 0 if fresh else OFFCHAIN_TTL
+    return cached_many(_offchain_cache, ttl, addresses, fetch_offchain_traits_many)
+
+def start_onchain_traits(addresses, fresh=False):
+    """
+    Begin the on-chain lookup for `addresses`; returns a callable that yields
+    {address: traits}. The cache is checked right here, and only a real GraphQL
+    fetch goes to the pool, so cache hits never wait behind stalled fetches.
+    """
+    ttl = 0 if fresh else ONCHAIN_TTL
+    hits, stale = cache_lookup(_onchain_cache, ttl, addresses)
+    if len(hits) == len(addresses):
+        return lambda: hits
+    future = _lookup_pool.submit(cache_fill, _onchain_cache, addresses, hits, stale, fetch_onchain_traits_many)
+    return future.result
+
+def fetch_offchain_traits(address: str):
+    doc = traits_col.find_one({"address": address}, TRAIT_PROJECTION) or {}
+    return offchain_traits_from_doc(doc)
+
+def fetch_offchain_traits_many(addresses):
+    """One `$in` query (served by the address index) for several addresses."""
+    cursor = traits_col.find({"address": {"$in": list(addresses)}}, BATCH_TRAIT_PROJECTION)
+    docs = {doc["address"]: doc for doc in cursor}
+    return {a: offchain_traits_from_doc(docs.get(a) or {}) for a in addresses}
+
+def offchain_traits_from_doc(doc):
+    score = _first_num(doc, ("score",))
+    out = {"Score": score, "Tier": derive_tier_label(score)}
+    for ui_key, fields in _TRAIT_FIELDS:
+        out[ui_key] = _first_num(doc, fields)
+    return out
+
+# Fixed query text; the exact keys only travel in variables
+ONCHAIN_QUERY = """
+query($keys: [String!]!, $first: Int!) {
+  allStates(filter: { key: { in: $keys } }, first: $first) {
+    edges { node { key value } }
+  }
+}
+"""
+# Compact JSON body up to the variables, encoded once: b'{"query":"...","variables":'
+ONCHAIN_BODY_PREFIX = b'{"query":' + _dumps(" ".join(ONCHAIN_QUERY.split())) + b',"variables":'
+
+def fetch_onchain_traits_many(addresses):
+    """
+    Fetch traits for one or more addresses in one GraphQL round-trip. Asks for the
+    exact state keys (point lookups, at most len(CHAIN_TO_UI) rows per address)
+    rather than a LIKE prefix scan.
+    """
+    keys = [state_key for a in addresses for state_key, _ in trait_state_keys(a)]
+    body = ONCHAIN_BODY_PREFIX + _dumps({"keys": keys, "first": len(keys)}) + b"}"
+    r = SESSION.post(GRAPHQL_URL, data=body, timeout=20)
     r.raise_for_status()
-    edges = (r.json().get("data", {}) or {}).get("allStates", {}).get("edges", []) or []
+    edges = (_json.loads(r.content).get("data", {}) or {}).get("allStates", {}).get("edges", []) or []
+    return parse_trait_edges(edges, addresses)
+
+@lru_cache(maxsize=4096)
+def trait_state_keys(address):
+    """((state key, ui key), ...) for every on-chain trait of `address`; shared by query and parse."""
+    prefix = f"{SBT_CONTRACT}.traits:{address}:"
+    return tuple((prefix + chain_key, ui_key) for chain_key, ui_key in CHAIN_TO_UI.items())
 
-    out = {k: ("" if k == "Tier" else 0) for k in TRAIT_KEYS}
+def parse_trait_edges(edges, addresses):
+    """Split `allStates` edges into {address: {ui_key: value}}, with defaults for missing traits."""
+    out = {a: ONCHAIN_DEFAULTS.copy() for a in addresses}
+    # full state key -> (traits dict to fill, ui key); anything else is ignored
+    lut = {
+        state_key: (out[a], ui_key)
+        for a in addresses
+        for state_key, ui_key in trait_state_keys(a)
+    }
     for e in edges:
-        key_str = e["node"]["key"]  # con_sbtxian.traits:ADDR:Trx Volume
-        try:
-            after = key_str.split(".traits:", 1)[1]
-            addr, chain_key = after.split(":", 1)
-            if addr != address:
-                continue
-            ui_key = CHAIN_TO_UI.get(chain_key)
-            if not ui_key:
-                continue
-            val = e["node"]["value"]
-            out[ui_key] = (str(val) if ui_key == "Tier" else _to_num(val))
-        except Exception:
+        node = e["node"]
+        hit = lut.get(node["key"])  # con_sbtxian.traits:ADDR:Trx Volume
+        if hit is None:
             continue
+        traits, ui_key = hit
+        val = node["value"]
+        traits[ui_key] = (str(val) if ui_key == "Tier" else _to_num(val))
     return out
 
 # ---------- API ----------
+def wants_fresh():
+    """`?fresh=1` or a request `Cache-Control: no-cache` skips the server-side caches."""
+    return request.args.get("fresh") == "1" or "no-cache" in request.headers.get("Cache-Control", "")
+
 @app.get("/api/compare_traits")
 def compare_traits():
     address = request.args.get("address", "").strip()
     if not address:
         return jsonify({"error": "Address is required"}), 400
+    if not ADDR_RE.match(address):
+        return jsonify({"error": "Invalid address"}), 400
+
+    # overlap the Mongo read with the (much slower) GraphQL round-trip
+    fresh = wants_fresh()
+    onchain = start_onchain_traits([address], fresh)
+    offchain = get_offchain_traits(address, fresh)
+    return jsonify(comparison(address, offchain, onchain()[address]))
 
-    offchain = get_offchain_traits(address)
-    onchain = get_onchain_traits(address)
+@app.get("/api/compare_traits_batch")
+def compare_traits_batch():
+    """`?address=a,b,c` → {"results": [compare_traits-shaped dict per unique address]}."""
+    raw = request.args.get("address", "")
+    # dedupe but keep the caller's order
+    addresses = list(dict.fromkeys(a.strip() for a in raw.split(",") if a.strip()))
+    if not addresses:
+        return jsonify({"error": "Address is required"}), 400
+    if len(addresses) > BATCH_MAX_ADDRESSES:
+        return jsonify({"error": f"At most {BATCH_MAX_ADDRESSES} addresses per request"}), 400
+    bad = [a for a in addresses if not ADDR_RE.match(a)]
+    if bad:
+        return jsonify({"error": "Invalid address", "addresses": bad}), 400
+
+    fresh = wants_fresh()
+    onchain_result = start_onchain_traits(addresses, fresh)
+    offchain = get_offchain_traits_many(addresses, fresh)
+    onchain = onchain_result()
+    results = [comparison(a, offchain[a], onchain[a]) for a in addresses]
+    return jsonify({"results": results})
+
+def trait_diffs(offchain, onchain, keys=DIFF_KEYS):
+    """
+    {key: {"off_chain": ..., "on_chain": ...}} for each of `keys` whose values disagree.
+    Both sides are already typed (numbers via _to_num, Tier as str), so compare directly.
+    """
+    return {
+        k: {"off_chain": offchain[k], "on_chain": onchain[k]}
+        for k in keys
+        if offchain[k] != onchain[k]
+    }
 
-    diffs = {}
-    if str(offchain["Score"]) != str(onchain["Score"]):
-        diffs["Score"] = {"off_chain": offchain["Score"], "on_chain": onchain["Score"]}
+def comparison(address, offchain, onchain):
+    return {"address": address, "offchain": offchain, "onchain": onchain, "diffs": trait_diffs(offchain, onchain)}
 
-    return jsonify({"address": address, "offchain": offchain, "onchain": onchain, "diffs": diffs})
+@app.after_request
+def add_api_cache_headers(resp):
+    # The UI rereads right after its own update, so clients must always revalidate
+    # (no-cache); an unchanged body still comes back as an empty 304 via the ETag
+    if request.method == "GET" and resp.status_code == 200 and request.path.startswith("/api/"):
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.add_etag(weak=True)
+        resp.make_conditional(request)
+    return resp
 
 # ---------- frontend ----------
 # Flask will serve /public automatically as static root.
 # Ensure /public/index.html exists. Root route returns it:
 @app.get("/")
 def root():
-    return send_from_directory("public", "index.html")
+    return send_from_directory("public", "index.html", max_age=0)
 
 if __name__ == "__main__":
+    # dev server only; production runs `gunicorn server:app` (see gunicorn.conf.py)
     # optional: show absolute path for sanity
     print("Serving static from:", os.path.abspath("public"))
     app.run(host="0.0.0.0", port=5000, debug=True)